@@ -1,9 +1,11 @@
 import os, sys
 from logging.config import fileConfig
+from multiprocessing import Process
 
 from alembic import context
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.engine.url import make_url
 
 sys.path = sys.path + [os.path.abspath("../server")]
 from models import metadata
@@ -18,25 +20,53 @@ def run_migrations_offline():
         url=os.environ["GD_PGSQL_DSN"],
         target_metadata=metadata,
         literal_binds=True,
+        transaction_per_migration=True,
     )
     with context.begin_transaction():
         context.run_migrations()
 
 
-def run_migrations_online():
+def run_migrations_online(dsn):
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
-        url=os.environ["GD_PGSQL_DSN"],
+        url=dsn,
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=metadata)
+        # Some revisions have autocommit blocks,
+        # which would commit all the previous revisions in the same run
+        context.configure(
+            connection=connection,
+            target_metadata=metadata,
+            transaction_per_migration=True,
+        )
         with context.begin_transaction():
             context.run_migrations()
 
 
+def run_migrations_parallel(dsns):
+    """Migrate several databases at once, one process for each."""
+    processes = [Process(target=run_migrations_online, args=(dsn,))
+                 for dsn in dsns]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failures = [repr(make_url(dsn)) # The URL repr hides the password
+                for dsn, process in zip(dsns, processes)
+                if process.exitcode != 0]
+    if failures:
+        raise RuntimeError(f"Migration failed in {len(failures)} of "
+                           f"{len(processes)} databases: "
+                           + ", ".join(failures))
+
+
 if context.is_offline_mode():
     run_migrations_offline()
+elif "GD_PGSQL_DSNS" in os.environ:
+    run_migrations_parallel([dsn.strip()
+                             for dsn in os.environ["GD_PGSQL_DSNS"].split(",")
+                             if dsn.strip()])
 else:
-    run_migrations_online()
+    run_migrations_online(os.environ["GD_PGSQL_DSN"])
@@ -0,0 +1,28 @@
+from alembic import op
+
+
+# Identifiers used by Alembic with generated codes (script.py.mako)
+revision = "10f88c33bf14"
+down_revision = "a336641643e8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Don't compute the digest again
+    # when an UPDATE doesn't touch the snapshot data
+    op.execute("DROP TRIGGER trigger_snapshot_hash ON snapshot")
+    op.execute("""
+CREATE TRIGGER trigger_snapshot_hash
+BEFORE INSERT OR UPDATE OF data, digest ON snapshot
+FOR EACH ROW EXECUTE PROCEDURE snapshot_hash()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER trigger_snapshot_hash ON snapshot")
+    op.execute("""
+CREATE TRIGGER trigger_snapshot_hash
+BEFORE INSERT OR UPDATE ON snapshot
+FOR EACH ROW EXECUTE PROCEDURE snapshot_hash()
+    """)
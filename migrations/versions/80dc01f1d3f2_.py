@@ -0,0 +1,75 @@
+from alembic import op
+
+
+# Identifiers used by Alembic with generated codes (script.py.mako)
+revision = "80dc01f1d3f2"
+down_revision = "10f88c33bf14"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Check the cycles once per INSERT statement instead of once per row
+    op.execute("DROP TRIGGER trigger_check_document_cycle ON document_event")
+    op.execute("""
+CREATE OR REPLACE FUNCTION check_document_cycle() RETURNS trigger
+LANGUAGE plpgsql
+AS $$BEGIN
+  IF EXISTS (
+    WITH RECURSIVE ancestors(hist, parent) AS (
+        SELECT hist, parent
+        FROM new_events
+      UNION
+        SELECT a.hist, e.parent
+        FROM ancestors a, document_event e
+        WHERE e.hist = a.parent
+      )
+    SELECT *
+    FROM ancestors
+    WHERE hist = parent
+  ) THEN
+    RAISE EXCEPTION 'parent_cycle';
+  END IF;
+  RETURN NULL;
+END$$
+    """)
+    op.execute("""
+CREATE TRIGGER trigger_check_document_cycle
+AFTER INSERT
+ON document_event
+REFERENCING NEW TABLE AS new_events
+FOR EACH STATEMENT
+EXECUTE PROCEDURE check_document_cycle()
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER trigger_check_document_cycle ON document_event")
+    op.execute("""
+CREATE OR REPLACE FUNCTION check_document_cycle() RETURNS trigger
+LANGUAGE plpgsql
+AS $$BEGIN
+  IF NEW.hist IN (
+    WITH RECURSIVE all_events(parent) AS (
+        SELECT NEW.parent
+      UNION
+        SELECT e.parent
+        FROM all_events ae, document_event e
+        WHERE e.hist = ae.parent
+      )
+    SELECT *
+    FROM all_events
+  ) THEN
+    RAISE EXCEPTION 'parent_cycle';
+  END IF;
+  RETURN NULL;
+END$$
+    """)
+    op.execute("""
+CREATE CONSTRAINT TRIGGER trigger_check_document_cycle
+AFTER INSERT
+ON document_event
+DEFERRABLE INITIALLY DEFERRED
+FOR EACH ROW
+EXECUTE PROCEDURE check_document_cycle()
+    """)
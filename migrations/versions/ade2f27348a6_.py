@@ -0,0 +1,23 @@
+from alembic import op
+
+
+# Identifiers used by Alembic with generated codes (script.py.mako)
+revision = "ade2f27348a6"
+down_revision = "80dc01f1d3f2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Used when walking the document history towards its root
+    with op.get_context().autocommit_block():
+        op.create_index("hist_index", "document_event", ["hist"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index("hist_index", table_name="document_event",
+            postgresql_concurrently=True,
+        )
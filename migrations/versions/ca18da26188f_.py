@@ -0,0 +1,42 @@
+from alembic import op
+
+
+# Identifiers used by Alembic with generated codes (script.py.mako)
+revision = "ca18da26188f"
+down_revision = "ade2f27348a6"
+branch_labels = None
+depends_on = None
+
+
+def replace_parent_hist_index(where=""):
+    """Rebuild the parent_hist_index unique index of document_event
+    without blocking writes. Every step can be run again
+    after a failed/cancelled run, which might leave behind
+    an invalid parent_hist_index_new or no parent_hist_index at all."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS parent_hist_index_new")
+        op.execute("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "
+                   "parent_hist_index_new ON document_event (parent, hist)"
+                   + where)
+        op.execute("""
+DO $$BEGIN
+  IF NOT (SELECT indisvalid
+          FROM pg_index
+          WHERE indexrelid = 'parent_hist_index_new'::regclass) THEN
+    RAISE EXCEPTION 'Invalid index: parent_hist_index_new';
+  END IF;
+END$$
+""")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS parent_hist_index")
+        op.execute("ALTER INDEX parent_hist_index_new "
+                   "RENAME TO parent_hist_index")
+
+
+def upgrade():
+    # Rows with a NULL parent are never duplicates in parent_hist_index,
+    # their uniqueness is already enforced by null_hist_index
+    replace_parent_hist_index(where=" WHERE parent IS NOT NULL")
+
+
+def downgrade():
+    replace_parent_hist_index()
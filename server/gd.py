@@ -1,31 +1,42 @@
 #!/usr/bin/env python3
 from datetime import datetime
+from itertools import chain
+import json
 import os
 import re
+from uuid import UUID, uuid4
 
 import asyncpg
-from asyncpgsa import pg
+from asyncpgsa import compile_query, pg
 from sanic import response, Sanic
 from sanic_cors import CORS
 from sanic_prometheus import monitor
-from sqlalchemy import func, literal, select
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import bindparam, cast, column, func, literal, \
+                       literal_column, select, table, text, Text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, ARRAY, insert
 import ujson
 
 from jweauth import SanicJWEAuth
-from ldapauth import LDAPAuth, LDAPInvalidCredentials, LDAPUserNotFound
+from ldapauth import LDAPAuth, LDAPInvalidCredentials, LDAPUserNotFound, \
+                     LDAP_USER_CACHE_SIZE, LDAP_USER_CACHE_TTL
 from models import t_user_info, t_document_hist, t_document_event, \
-                   t_snapshot, SQL_UTC
+                   t_snapshot, SQL_NULL, SQL_UTC
 from misc import nestget_str
 
 
 app = Sanic(__name__)
 CORS(app, automatic_options=True)
-app.static("/", "client/dist/index.html")
-app.static("/main.css", "client/dist/main.css")
-app.static("/main.js", "client/dist/main.js")
-app.static("/assets", "client/dist/assets")
-ldap = LDAPAuth(os.environ["GD_LDAP_DSN"])
+if not os.environ.get("GD_NO_STATIC"): # Else they're served otherwhere
+    app.static("/", "client/dist/index.html")
+    app.static("/main.css", "client/dist/main.css")
+    app.static("/main.js", "client/dist/main.js")
+    app.static("/assets", "client/dist/assets")
+ldap = LDAPAuth(os.environ["GD_LDAP_DSN"],
+    user_cache_size=int(os.environ.get("GD_LDAP_USER_CACHE_SIZE",
+                                       LDAP_USER_CACHE_SIZE)),
+    user_cache_ttl=float(os.environ.get("GD_LDAP_USER_CACHE_TTL",
+                                        LDAP_USER_CACHE_TTL)),
+)
 
 
 try:
@@ -41,6 +52,216 @@ except OSError as exc:
         raise            # after this Prometheus client bug gets fixed
 
 
+CAMEL_CASE_REGEX = re.compile(r"([^A-Z])([A-Z])")
+INTEGRITY_ERROR_NAMES = { # Snake case names of the asyncpg exceptions
+    cls: CAMEL_CASE_REGEX.sub(r"\1_\2", cls.__name__).lower()
+    for cls in [asyncpg.IntegrityConstraintViolationError,
+                *asyncpg.IntegrityConstraintViolationError.__subclasses__()]
+}
+SQL_EMPTY_JSON_ARRAY = text("'[]'::json")
+STREAM_CHUNK_SIZE = 1000
+
+# Constant response bodies serialized just once
+NOT_FOUND_JSON = ujson.dumps({"error": "not_found"}).encode()
+INVALID_SNAPSHOT_JSON = ujson.dumps({"error": "invalid_snapshot"}).encode()
+UPDATED_JSON = ujson.dumps({"status": "updated"}).encode()
+DELETED_JSON = ujson.dumps({"status": "deleted"}).encode()
+INSERTED_JSON = ujson.dumps({"status": "inserted"}).encode()
+REPLACED_JSON = ujson.dumps({"status": "replaced"}).encode()
+SNAPSHOT_COPY_FIELDS = ("data", "source", "tstamp")
+SNAPSHOT_COPY_TABLE_SQL = (
+    "CREATE TEMPORARY TABLE snapshot_copy ON COMMIT DROP AS "
+    f"SELECT {', '.join(SNAPSHOT_COPY_FIELDS)} FROM snapshot WITH NO DATA"
+)
+t_snapshot_copy = table("snapshot_copy", *map(column, SNAPSHOT_COPY_FIELDS))
+
+# Static queries compiled just once, their bind parameters become
+# $1, $2, ... in the alphabetical order of their names
+WHERE_HID = t_document_hist.c.hid == bindparam("hid")
+WHERE_EDGE = (t_document_event.c.parent == bindparam("parent")) & \
+             (t_document_event.c.hist == bindparam("hist"))
+WHERE_NULL_EDGE = (t_document_event.c.parent == SQL_NULL) & \
+                  (t_document_event.c.hist == bindparam("hist"))
+GET_NODE_SQL = compile_query(t_document_hist.select().where(WHERE_HID),
+                             inline=True)
+DELETE_NODE_SQL = compile_query(t_document_hist.delete().where(WHERE_HID),
+                                inline=True)
+GET_EDGE_SQL = compile_query(t_document_event.select().where(WHERE_EDGE),
+                             inline=True)
+GET_NULL_EDGE_SQL = compile_query(
+    t_document_event.select().where(WHERE_NULL_EDGE),
+    inline=True,
+)
+DELETE_EDGE_SQL = compile_query(
+    t_document_event.delete().where(WHERE_EDGE),
+    inline=True,
+)
+DELETE_NULL_EDGE_SQL = compile_query(
+    t_document_event.delete().where(WHERE_NULL_EDGE),
+    inline=True,
+)
+# The UUIDs in the lists are rendered by PostgreSQL
+GET_NODES_SQL = compile_query(
+    select([cast(t_document_hist.c.hid, Text).label("hid")]),
+    inline=True,
+)
+GET_EDGES_SQL = compile_query(
+    select([cast(t_document_event.c.parent, Text).label("parent"),
+            cast(t_document_event.c.hist, Text).label("hist")]),
+    inline=True,
+)
+
+
+def raw_json(body, status=200):
+    """Response with an already serialized JSON body (bytes)."""
+    return response.raw(body, status=status, content_type="application/json")
+
+
+def iso_tstamp(dt):
+    """Format a naive UTC datetime like
+    ``dt.strftime("%Y-%m-%dT%H:%M:%S.%fZ")``,
+    without parsing a format string in every call."""
+    return dt.isoformat(timespec="microseconds") + "Z"
+
+
+def sql_iso_tstamp(column):
+    """SQL expression to format a UTC timestamp column
+    like ``iso_tstamp`` does."""
+    return func.to_char(column,
+                        literal_column("""'YYYY-MM-DD"T"HH24:MI:SS.US"Z"'"""))
+
+
+def sql_json_object(**fields):
+    """SQL expression to build a JSON object (in the same key order),
+    with the keys as literals since they can't be typed parameters."""
+    return func.json_build_object(*chain.from_iterable(
+        (literal_column(f"'{key}'"), value) for key, value in fields.items()
+    ))
+
+
+def graph_json_query():
+    """Query of the whole JSON for the graph of events connected to the
+    ``hid`` bind parameter, built by the server in a single statement."""
+    cte_query = t_document_event.select() \
+                                .where(t_document_event.c.hist ==
+                                       bindparam("hid")) \
+                                .cte("all_events", recursive=True)
+    ref_query = cte_query.alias("ref")
+    evt_query = t_document_event.alias("evt")
+    all_events_cte = cte_query.union(
+        select(
+            columns=[evt_query],
+            from_obj=[ref_query, evt_query],
+            whereclause=(evt_query.c.parent == ref_query.c.hist) |
+                        (evt_query.c.hist == ref_query.c.parent),
+        )
+    )
+    nodes_json = select([func.coalesce(
+        func.json_agg(aggregate_order_by(
+            sql_json_object(
+                hid=t_document_hist.c.hid,
+                pid=t_document_hist.c.pid,
+                title=t_document_hist.c.title,
+                tstamp=sql_iso_tstamp(t_document_hist.c.tstamp),
+            ),
+            t_document_hist.c.tstamp,
+        )),
+        SQL_EMPTY_JSON_ARRAY,
+    )]).where(
+        t_document_hist.c.hid.in_(select([all_events_cte.c.hist]))
+    ).as_scalar()
+    edges_json = select([func.coalesce(
+        func.json_agg(aggregate_order_by(
+            sql_json_object(
+                parent=all_events_cte.c.parent,
+                hist=all_events_cte.c.hist,
+                reason=all_events_cte.c.reason,
+                comment=all_events_cte.c.comment,
+                tstamp=sql_iso_tstamp(all_events_cte.c.tstamp),
+            ),
+            all_events_cte.c.tstamp,
+        )),
+        SQL_EMPTY_JSON_ARRAY,
+    )]).as_scalar()
+    return select([sql_json_object(nodes=nodes_json, edges=edges_json)])
+
+
+GET_GRAPH_SQL = compile_query(graph_json_query(), inline=True)
+
+
+def sql_unnest(name, column):
+    """SQL expression for the rows of the array in the ``name`` bind
+    parameter, typed like the ``column``. Several of them in the same
+    ``SELECT`` are expanded in parallel, as a zip."""
+    return func.unnest(cast(bindparam(name), ARRAY(column.type)))
+
+
+def insert_documents_query():
+    """Query inserting the documents and events from the ``hid``,
+    ``pid``, ``title``, ``published``, ``parent`` and ``reason`` arrays
+    (by the ``uid`` user), returning their IDs and timestamps.
+    Its SQL and its number of bind parameters don't depend on the
+    number of documents, unlike a multi-row ``VALUES``."""
+    # The triggers checking the parents run at the end of the statement,
+    # after all nodes and edges get inserted
+    nodes_cte = t_document_hist.insert().from_select(
+        ["hid", "pid", "title", "published"],
+        select([
+            sql_unnest("hid", t_document_hist.c.hid),
+            sql_unnest("pid", t_document_hist.c.pid),
+            sql_unnest("title", t_document_hist.c.title),
+            sql_unnest("published", t_document_hist.c.published),
+        ]),
+    ).returning(
+        t_document_hist.c.hid,
+        t_document_hist.c.tstamp,
+    ).cte("nodes")
+    edges_cte = t_document_event.insert().from_select(
+        ["parent", "hist", "uid", "reason"],
+        select([
+            sql_unnest("parent", t_document_event.c.parent),
+            sql_unnest("hid", t_document_event.c.hist),
+            cast(bindparam("uid"), t_document_event.c.uid.type),
+            sql_unnest("reason", t_document_event.c.reason),
+        ]),
+    ).returning(
+        t_document_event.c.hist,
+        t_document_event.c.tstamp,
+    ).cte("edges")
+    return select(
+        columns=[
+            nodes_cte.c.hid,
+            nodes_cte.c.tstamp.label("content_tstamp"),
+            edges_cte.c.tstamp.label("action_tstamp"),
+        ],
+        from_obj=nodes_cte.join(edges_cte,
+                                nodes_cte.c.hid == edges_cte.c.hist),
+    )
+
+
+INSERT_DOCUMENTS_SQL = compile_query(insert_documents_query(), inline=True)
+
+
+def json_list_streamer(key, query, row_to_json):
+    """Create a streaming function for ``response.stream``
+    that writes ``{"<key>": [...]}`` from the query result,
+    fetching it with a cursor in chunks of ``STREAM_CHUNK_SIZE`` rows,
+    each row encoded by the ``row_to_json`` function."""
+    async def streaming_fn(response):
+        await response.write(f'{{"{key}":[')
+        separator = ""
+        async with pg.transaction() as conn: # Cursors require a transaction
+            cursor = await conn.cursor(query)
+            rows = await cursor.fetch(STREAM_CHUNK_SIZE)
+            while rows:
+                await response.write(separator +
+                                     ",".join(map(row_to_json, rows)))
+                separator = ","
+                rows = await cursor.fetch(STREAM_CHUNK_SIZE)
+        await response.write("]}")
+    return streaming_fn
+
+
 class AuthError(Exception):
     pass
 
@@ -74,16 +295,52 @@ jwe = SanicJWEAuth(app, authenticate,
 )
 
 
+def pgsql_pool_sizes(default=10):
+    """Get the minimum and maximum sizes of the PostgreSQL connection
+    pool from the ``GD_PGSQL_POOL_MIN`` and ``GD_PGSQL_POOL_MAX``
+    environment variables. A missing one defaults to ``default``,
+    limited by the other one."""
+    min_env = os.environ.get("GD_PGSQL_POOL_MIN")
+    max_env = os.environ.get("GD_PGSQL_POOL_MAX")
+    if min_env and max_env:
+        min_size, max_size = int(min_env), int(max_env)
+    elif min_env:
+        min_size = int(min_env)
+        max_size = max(default, min_size)
+    elif max_env:
+        max_size = int(max_env)
+        min_size = min(default, max_size)
+    else:
+        min_size = max_size = default
+    if min_size > max_size:
+        raise ValueError(f"GD_PGSQL_POOL_MIN={min_size} is greater than "
+                         f"GD_PGSQL_POOL_MAX={max_size}")
+    return min_size, max_size
+
+
+pgsql_pool_min_size, pgsql_pool_max_size = pgsql_pool_sizes()
+
+
+@app.listener("before_server_start")
+def aes_self_test(app, loop):
+    if os.environ.get("GD_AES_SELF_TEST"): # Opt-in, it delays the startup
+        jwe.jc.self_test()
+
+
 @app.listener("before_server_start")
 async def setup_db(app, loop):
-    await pg.init(os.environ["GD_PGSQL_DSN"])
+    await pg.init(
+        os.environ["GD_PGSQL_DSN"],
+        min_size=pgsql_pool_min_size,
+        max_size=pgsql_pool_max_size,
+    )
 
 
 @app.exception(asyncpg.IntegrityConstraintViolationError)
 def handle_database_integrity_constraint_violation(request, exc):
     return response.json({
-        "error": re.sub(r"([^A-Z])([A-Z])", r"\1_\2",
-                        type(exc).__name__).lower(),
+        "error": INTEGRITY_ERROR_NAMES.get(type(exc)) or
+                 CAMEL_CASE_REGEX.sub(r"\1_\2", type(exc).__name__).lower(),
         "constraint": exc.constraint_name,
         "table": exc.table_name,
         "column": exc.column_name,
@@ -110,6 +367,34 @@ def handle_database_exception(request, exc):
                           "message": exc.message}, status=500)
 
 
+def document_payload_error(payload, with_parent=False):
+    """Validate the input of a new document,
+    returning the error code or ``None`` if the payload is valid.
+    The optional ``"parent"`` field is checked only ``with_parent``."""
+    if not isinstance(payload, dict):
+        return "need_json_object"
+    if "pid" not in payload or not isinstance(payload["pid"], str):
+        return "need_pid_string"
+    if "title" not in payload or not isinstance(payload["title"], str):
+        return "need_title_string"
+    if "published" in payload and not isinstance(payload["published"], bool):
+        return "invalid_published_type"
+    if with_parent and payload.get("parent") is not None \
+                   and not is_uuid(payload["parent"]):
+        return "invalid_parent"
+    return None
+
+
+def is_uuid(value):
+    """Check if the value is a string with a UUID in its canonical
+    hyphenated form (in any letter case), rejecting the other forms
+    accepted by ``uuid.UUID`` like ``"urn:uuid:..."`` and ``"{...}"``."""
+    try:
+        return str(UUID(value)) == value.lower()
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
 @app.route("/user")
 @jwe.require_authorization
 async def get_user(request):
@@ -126,109 +411,97 @@ async def get_user(request):
 @jwe.require_authorization
 async def post_document(request, parent=None):
     payload = request.json
-    if "pid" not in payload or not isinstance(payload["pid"], str):
-        return response.json({"error": "need_pid_string"}, status=400)
-    if "title" not in payload or not isinstance(payload["title"], str):
-        return response.json({"error": "need_title_string"}, status=400)
-    if "published" in payload and not isinstance(payload["published"], bool):
-        return response.json({"error": "invalid_published_type"}, status=400)
+    error = document_payload_error(payload)
+    if error:
+        return response.json({"error": error}, status=400)
+    [document] = await insert_documents(
+        [{**payload, "parent": parent and str(parent)}],
+        uid=request["session"]["uid"],
+    )
+    return response.json(document)
 
-    async with pg.transaction() as conn:
-        node = await conn.fetchrow(t_document_hist.insert().values(
-            pid=payload["pid"],
-            title=payload["title"],
-            published=payload.get("published", False),
-        ).returning(t_document_hist.c.hid, t_document_hist.c.tstamp))
-        edge = await conn.fetchrow(t_document_event.insert().values(
-            parent=parent,
-            hist=node["hid"],
-            uid=request["session"]["uid"],
-            reason="insert" if parent is None else "update",
-        ).returning(t_document_event.c.tstamp))
-    return response.json({
-        "hid": str(node["hid"]),
-        "content_tstamp": node["tstamp"] and
-                          node["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        "action_tstamp": edge["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-    })
+
+@app.route("/document/batch", methods=["POST"])
+@jwe.require_authorization
+async def post_document_batch(request):
+    payloads = []
+    for row in request.body.splitlines():
+        if row.strip(): # ujson parses the UTF-8 bytes as is
+            payload = ujson.loads(row)
+            error = document_payload_error(payload, with_parent=True)
+            if error:
+                return response.json({"error": error}, status=400)
+            payloads.append(payload)
+    documents = await insert_documents(payloads,
+                                       uid=request["session"]["uid"])
+    return response.json({"status": "inserted", "documents": documents})
+
+
+async def insert_documents(payloads, uid):
+    """Insert the documents (validated payloads with an optional parent)
+    and their events using a single statement and round-trip,
+    returning their IDs and timestamps in the same order."""
+    if not payloads:
+        return []
+    # Required beforehand to link the events
+    hids = [str(uuid4()) for payload in payloads]
+    parents = [payload.get("parent") for payload in payloads]
+    rows = await pg.fetch(
+        INSERT_DOCUMENTS_SQL,
+        hids, # The bind parameters are in alphabetical order
+        parents,
+        [payload["pid"] for payload in payloads],
+        [payload.get("published", False) for payload in payloads],
+        ["update" if parent else "insert" for parent in parents],
+        [payload["title"] for payload in payloads],
+        uid,
+    )
+    rows_by_hid = {str(row["hid"]): row for row in rows}
+    return [{
+        "hid": hid,
+        "content_tstamp": row["content_tstamp"] and
+                          iso_tstamp(row["content_tstamp"]),
+        "action_tstamp": iso_tstamp(row["action_tstamp"]),
+    } for hid, row in zip(hids, map(rows_by_hid.get, hids))]
 
 
 @app.route("/graph/<hid:uuid>")
 async def get_graph(request, hid):
-    cte_query = t_document_event.select() \
-                                .where(t_document_event.c.hist == str(hid)) \
-                                .cte("all_events", recursive=True)
-    ref_query = cte_query.alias("ref")
-    evt_query = t_document_event.alias("evt")
-    full_events_query = cte_query.union(
-        select(
-            columns=[evt_query],
-            from_obj=[ref_query, evt_query],
-            whereclause=(evt_query.c.parent == ref_query.c.hist) |
-                        (evt_query.c.hist == ref_query.c.parent),
-        )
-    ).select().order_by(cte_query.c.tstamp)
-
-    async with pg.transaction(isolation="repeatable_read") as conn:
-        edges = await conn.fetch(full_events_query)
-        nodes = await conn.fetch(t_document_hist.select().where(
-            t_document_hist.c.hid.in_([r["hist"] for r in edges])
-        ).order_by(t_document_hist.c.tstamp))
-    return response.json({
-        "nodes": [{
-            "hid": str(node["hid"]),
-            "pid": node["pid"],
-            "title": node["title"],
-            "tstamp": node["tstamp"] and
-                      node["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        } for node in nodes],
-        "edges": [{
-            "parent": edge["parent"] and str(edge["parent"]),
-            "hist": str(edge["hist"]),
-            "reason": edge["reason"],
-            "comment": edge["comment"],
-            "tstamp": edge["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
-        } for edge in edges],
-    })
+    graph_json = await pg.fetchval(GET_GRAPH_SQL, hid)
+    return response.text(graph_json, content_type="application/json")
 
 
 @app.route("/node/<hid:uuid>")
 async def get_node(request, hid):
-    node_query = t_document_hist.select().where(t_document_hist.c.hid == hid)
-    node = await pg.fetchrow(node_query)
+    node = await pg.fetchrow(GET_NODE_SQL, hid)
     if not node:
-        return response.json({"error": "not_found"}, status=404)
-    if node["deleted"]:
-        return response.json({"error": "gone"}, status=410)
+        return raw_json(NOT_FOUND_JSON, status=404)
     return response.json({
         "hid": str(node["hid"]),
         "pid": node["pid"],
         "title": node["title"],
         "metadata": ujson.loads(node["metadata"]),
         "published": node["published"],
-        "tstamp": node["tstamp"] and
-                  node["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "tstamp": node["tstamp"] and iso_tstamp(node["tstamp"]),
     })
 
 
 @app.route("/edge/<parent:uuid>/<hist:uuid>")
 @app.route("/edge/null/<hist:uuid>")
 async def get_edge_event(request, parent=None, hist=None):
-    edge_query = t_document_event.select().where(
-        (t_document_event.c.parent == parent) &
-        (t_document_event.c.hist == hist)
-    )
-    edge = await pg.fetchrow(edge_query)
+    if parent is None:
+        edge = await pg.fetchrow(GET_NULL_EDGE_SQL, hist)
+    else:
+        edge = await pg.fetchrow(GET_EDGE_SQL, hist, parent)
     if not edge:
-        return response.json({"error": "not_found"}, status=404)
+        return raw_json(NOT_FOUND_JSON, status=404)
     return response.json({
         "parent": str(edge["parent"]),
         "hist": str(edge["hist"]),
         "uid": edge["uid"],
         "reason": edge["reason"],
         "comment": edge["comment"],
-        "tstamp": edge["tstamp"] and
-                  edge["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "tstamp": edge["tstamp"] and iso_tstamp(edge["tstamp"]),
     })
 
 
@@ -238,7 +511,7 @@ async def patch_node(request, hid):
     await pg.fetchrow(t_document_hist.update().values(
         **request.json # TODO: validate the input
     ).where(t_document_hist.c.hid == hid))
-    return response.json({"status": "updated"})
+    return raw_json(UPDATED_JSON)
 
 
 @app.route("/edge/<parent:uuid>/<hist:uuid>", methods=["PATCH"])
@@ -251,33 +524,31 @@ async def patch_edge_event(request, parent=None, hist=None):
         (t_document_event.c.parent == parent) &
         (t_document_event.c.hist == hist)
     ))
-    return response.json({"status": "updated"})
+    return raw_json(UPDATED_JSON)
 
 
 @app.route("/node/<hid:uuid>", methods=["DELETE"])
 @jwe.require_authorization
 async def delete_node(request, hid):
-    str_result = await pg.execute(
-        t_document_hist.delete().where(t_document_hist.c.hid == hid)
-    )
+    str_result = await pg.execute(DELETE_NODE_SQL, hid)
     deleted_count = int(str_result.split()[1])
     if deleted_count == 0:
-        return response.json({"error": "not_found"}, status=404)
-    return response.json({"status": "deleted"})
+        return raw_json(NOT_FOUND_JSON, status=404)
+    return raw_json(DELETED_JSON)
 
 
 @app.route("/edge/<parent:uuid>/<hist:uuid>", methods=["DELETE"])
 @app.route("/edge/null/<hist:uuid>", methods=["DELETE"])
 @jwe.require_authorization
 async def delete_edge_event(request, parent=None, hist=None):
-    str_result = await pg.fetch(t_document_event.delete().where(
-        (t_document_event.c.parent == parent) &
-        (t_document_event.c.hist == hist)
-    ))
+    if parent is None:
+        str_result = await pg.execute(DELETE_NULL_EDGE_SQL, hist)
+    else:
+        str_result = await pg.execute(DELETE_EDGE_SQL, hist, parent)
     deleted_count = int(str_result.split()[1])
     if deleted_count == 0:
-        return response.json({"error": "not_found"}, status=404)
-    return response.json({"status": "deleted"})
+        return raw_json(NOT_FOUND_JSON, status=404)
+    return raw_json(DELETED_JSON)
 
 
 @app.route("/node", methods=["POST"])
@@ -301,7 +572,7 @@ async def post_edge_event(request, parent=None, hist=None):
         hist=hist,
         **request.json # TODO: validate the input
     ))
-    return response.json({"status": "inserted"})
+    return raw_json(INSERTED_JSON)
 
 
 @app.route("/node/<hid:uuid>", methods=["PUT"])
@@ -334,70 +605,87 @@ async def put_edge_event(request, parent=None, hist=None):
             hist=hist,
             **request.json # TODO: validate the input
         ))
-    return response.json({"status": "replaced"})
+    return raw_json(REPLACED_JSON)
 
 
 @app.route("/node")
 @jwe.require_authorization
 async def get_nodes(request):
-    get_nodes_query = select([t_document_hist.c.hid])
-    nodes = await pg.fetch(get_nodes_query)
-    return response.json({"nodes": [str(node["hid"]) for node in nodes]})
+    return response.stream(
+        json_list_streamer("nodes", GET_NODES_SQL,
+                           lambda node: f'"{node["hid"]}"'),
+        content_type="application/json",
+    )
 
 
 @app.route("/edge")
 @jwe.require_authorization
 async def get_edges(request):
-    get_edges_query = select([t_document_event.c.parent,
-                              t_document_event.c.hist])
-    edges = await pg.fetch(get_edges_query)
-    return response.json({"edges": [{
-        "parent": edge["parent"] and str(edge["parent"]),
-        "hist": str(edge["hist"]),
-    } for edge in edges]})
+    return response.stream(
+        json_list_streamer("edges", GET_EDGES_SQL,
+                           lambda edge: ujson.dumps(dict(edge))),
+        content_type="application/json",
+    )
 
 
 @app.route("/snapshot", methods=["POST"])
 @jwe.require_authorization
 async def post_snapshot(request):
-    if not request.json or "uid" in request.json:
-        return response.json({"error": "invalid_snapshot"}, status=400)
-    data = {**request.json, "uid": request["session"]["uid"]}
+    data = request.json # Parsed for this request only, it can be changed
+    if not data or "uid" in data:
+        return raw_json(INVALID_SNAPSHOT_JSON, status=400)
+    data["uid"] = request["session"]["uid"]
     if "tstamp" in data:
-        data["tstamp"] = datetime.fromtimestamp(data["tstamp"])
+        data["tstamp"] = datetime.utcfromtimestamp(data["tstamp"])
     query = t_snapshot.insert().values(**data).returning(t_snapshot.c.tstamp)
     snapshot = await pg.fetchrow(query)
     return response.json({
         "status": "inserted",
-        "tstamp": snapshot["tstamp"].strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        "tstamp": iso_tstamp(snapshot["tstamp"]),
     })
 
 
 @app.route("/snapshot/batch", methods=["POST"])
 @jwe.require_authorization
 async def post_snapshot_batch(request):
-    rows = []
+    records = []
     for row in request.body.splitlines():
-        unicode_row = row.strip().decode("utf-8")
-        if unicode_row:
-            row_data = ujson.loads(unicode_row)
-            if "uid" in row_data:
-                return response.json({"error": "invalid_snapshot"}, status=400)
-            data = {**row_data, "uid": request["session"]["uid"]}
-            if "tstamp" in data:
-                data["tstamp"] = datetime.fromtimestamp(data["tstamp"])
-            rows.append(data)
-    if rows:
-        query = select(
-            columns=[func.count()],
-            from_obj=insert(t_snapshot).values(rows)
-                                       .on_conflict_do_nothing()
-                                       .returning(literal("1"))
-                                       .cte("rows"),
+        if row.strip(): # ujson parses the UTF-8 bytes as is
+            row_data = ujson.loads(row)
+            if not isinstance(row_data, dict) or \
+                    row_data.keys() - SNAPSHOT_COPY_FIELDS:
+                return raw_json(INVALID_SNAPSHOT_JSON, status=400)
+            tstamp = row_data.get("tstamp")
+            records.append((
+                # Same encoder of the SQLAlchemy dialect, as ujson.dumps
+                # rounds floats to 10 decimal places
+                json.dumps(row_data["data"]) if "data" in row_data else None,
+                row_data.get("source"),
+                None if tstamp is None else datetime.utcfromtimestamp(tstamp),
+            ))
+    if not records:
+        return response.json({"status": "inserted", "count": 0})
+
+    # COPY has no ON CONFLICT, the data goes to a temporary table first
+    async with pg.transaction() as conn:
+        await conn.execute(SNAPSHOT_COPY_TABLE_SQL)
+        await conn.copy_records_to_table(
+            "snapshot_copy",
+            records=records,
+            columns=SNAPSHOT_COPY_FIELDS,
         )
-        snapshot_count = await pg.fetchval(query)
-    else:
-        snapshot_count = 0
+        snapshot_count = await conn.fetchval(select(
+            columns=[func.count()],
+            from_obj=insert(t_snapshot).from_select(
+                [*SNAPSHOT_COPY_FIELDS, "uid"],
+                select([
+                    t_snapshot_copy.c.data,
+                    t_snapshot_copy.c.source,
+                    func.coalesce(t_snapshot_copy.c.tstamp, SQL_UTC),
+                    literal(request["session"]["uid"]),
+                ]),
+            ).on_conflict_do_nothing().returning(literal("1")).cte("rows"),
+        ))
     return response.json({
         "status": "inserted",
         "count": snapshot_count,
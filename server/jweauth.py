@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from functools import update_wrapper
 from time import time
 
@@ -7,16 +8,20 @@ from jweconv import JWEConverter, JWEInvalid, JWEWithoutJSON, \
                     JWEExpired, JWENotYetValid
 
 
+JWE_CACHE_SIZE = 4096
+QUOTE_ESCAPE_TABLE = str.maketrans({'"': r'\"'})
+
+
 class UnknownAuthorizationHeader(Exception): pass
 class NoAuthorizationHeader(Exception): pass
 
 
 def get_auth_token(request):
-    auth_prefix = "Bearer "
     auth_header = request.headers.get("Authorization", "")
-    if auth_header and not auth_header.startswith(auth_prefix):
+    scheme, sep, token = auth_header.partition(" ")
+    if auth_header and (scheme != "Bearer" or not sep):
         raise UnknownAuthorizationHeader
-    return auth_header[len(auth_prefix):]
+    return token
 
 
 class SanicJWEAuth:
@@ -93,12 +98,17 @@ class SanicJWEAuth:
         self.authenticate = authenticate
         self.auth_exceptions = tuple(auth_exceptions)
         self.realm = realm
+        escaped_realm = realm.translate(QUOTE_ESCAPE_TABLE)
+        self.challenge = f'Bearer realm="{escaped_realm}"'
         self.jc = JWEConverter(octet)
         self.auth_fields = auth_fields
+        self.auth_field_pairs = tuple(auth_fields.items())
         self.session_fields = session_fields
+        self.session_field_pairs = tuple(session_fields.items())
         self.session_request_key = session_request_key
         self.session_duration = session_duration
         self.token_duration = token_duration
+        self.jwe_cache = OrderedDict()
         app.add_route(self.get_handler, route, methods=["GET"])
         app.add_route(self.post_handler, route, methods=["POST"])
 
@@ -125,24 +135,38 @@ class SanicJWEAuth:
             The token "nbf" (Not Before) claim is before now.
         JWEMissingClaim
             A required field ("sub"/"exp"/"nbf") isn't in the token.
+
+        The contents of the ``JWE_CACHE_SIZE`` most recently used tokens
+        are kept in this process, so that these don't get decrypted again,
+        but their "exp" and "nbf" claims are checked on every call.
         """
         access_token = get_auth_token(request)
         if not access_token:
             raise NoAuthorizationHeader
-        return self.jc.decrypt(access_token, check_exp=check_exp)
+        try:
+            claims = self.jwe_cache[access_token]
+        except KeyError:
+            claims = self.jc.decrypt(access_token, check_exp=check_exp)
+            self.jwe_cache[access_token] = claims
+            if len(self.jwe_cache) > JWE_CACHE_SIZE:
+                self.jwe_cache.popitem(last=False)
+        else:
+            self.jc.check_claims(claims, check_exp=check_exp)
+            self.jwe_cache.move_to_end(access_token)
+        return dict(claims) # Copy, so that the cached one remains intact
 
     def unauthorized(self, **kwargs):
         """Create a HTTP 401 response with a single Bearer challenge
         defined in its WWW-Authenticate header.
         The keyword arguments are mapped as header parameters.
         """
-        challenge = ", ".join(
-            k + '="' + v.replace('"', r'\"') + '"'
-            for k, v in {"realm": self.realm, **kwargs}.items()
+        challenge_params = "".join(
+            f', {k}="{v.translate(QUOTE_ESCAPE_TABLE)}"'
+            for k, v in kwargs.items()
         )
         return response.json({"error": "unauthorized"},
             status=401,
-            headers={"WWW-Authenticate": "Bearer " + challenge}
+            headers={"WWW-Authenticate": self.challenge + challenge_params}
         )
 
     def require_authorization(self, *args, check_exp=True):
@@ -152,19 +176,24 @@ class SanicJWEAuth:
         For more information about ``check_exp``,
         see the ``jweconv.JWEConverter.decrypt method`` docs.
         """
+        get_jwe = self.get_jwe
+        unauthorized = self.unauthorized
+        session_field_pairs = self.session_field_pairs
+        session_request_key = self.session_request_key
+
         def decorator(afunc):
             async def handler_wrapper(request, *args, **kwargs):
                 try:
-                    jwe = self.get_jwe(request, check_exp=check_exp)
+                    jwe = get_jwe(request, check_exp=check_exp)
                 except (NoAuthorizationHeader, UnknownAuthorizationHeader):
-                    return self.unauthorized()
+                    return unauthorized()
                 except JWENotYetValid:
-                    return self.unauthorized(error="unsynchronized")
+                    return unauthorized(error="unsynchronized")
                 except (JWEInvalid, JWEWithoutJSON, JWEExpired):
-                    return self.unauthorized(error="invalid_token")
+                    return unauthorized(error="invalid_token")
                 session = {k: jwe.get(v, None)
-                           for k, v in self.session_fields.items()}
-                request[self.session_request_key] = session
+                           for k, v in session_field_pairs}
+                request[session_request_key] = session
                 return await afunc(request, *args, **kwargs)
             return update_wrapper(handler_wrapper, afunc)
         return decorator(*args) if args else decorator
@@ -186,9 +215,9 @@ class SanicJWEAuth:
         by means of an exception.
         """
         user_data = await self.authenticate(**auth_kwargs)
-        session_jwe = {self.session_fields[k]: v for k, v in user_data.items()
-                                                 if k in self.session_fields}
-        auth_jwe = {self.auth_fields[k]: v for k, v in auth_kwargs.items()}
+        session_jwe = {v: user_data[k] for k, v in self.session_field_pairs
+                                       if k in user_data}
+        auth_jwe = {v: auth_kwargs[k] for k, v in self.auth_field_pairs}
         return self.jc.encrypt({**session_jwe, **auth_jwe},
                                exp_delta=self.token_duration,
                                nbf=nbf)
@@ -211,7 +240,7 @@ class SanicJWEAuth:
     async def post_handler(self, request):
         """Handler of the authentication route."""
         payload = request.json
-        if not payload or set(payload.keys()) != set(self.auth_fields.keys()):
+        if not payload or payload.keys() != self.auth_fields.keys():
             return response.json({"error": "bad_request"}, status=400)
         return await self.create_response(payload)
 
@@ -234,5 +263,5 @@ class SanicJWEAuth:
                 "token_type": "bearer",
                 "expires_in": exp_minus_now,
             })
-        auth_kwargs = {k: jwe[v] for k, v in self.auth_fields.items()}
+        auth_kwargs = {k: jwe[v] for k, v in self.auth_field_pairs}
         return await self.create_response(auth_kwargs, nbf=jwe["nbf"])
@@ -1,7 +1,13 @@
-from time import time
+from base64 import urlsafe_b64encode
+import logging
+import os
+import re
+from time import perf_counter, time_ns
 
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.ciphers import algorithms, Cipher, modes
 from jwcrypto import jwe, jwk
-from jwcrypto.common import base64url_encode
+from jwcrypto.common import base64url_decode, json_encode
 import ujson
 
 
@@ -13,13 +19,45 @@ class JWEExpired(JWEDecryptException): pass
 class JWENotYetValid(JWEDecryptException): pass
 
 
+JWE_HEADERLESS_KEYS = ["encrypted_key", "iv", "ciphertext", "tag"]
+JWE_HEADERLESS_REGEX = re.compile(r"[A-Za-z0-9_-]+(?:\.[A-Za-z0-9_-]+){3}")
+# Sizes in bytes of the initialization vector and of the authentication tag,
+# which tell a headerless token's encryption algorithm (RFC7518 Section 5)
+JWE_ENC_IV_TAG_SIZES = {
+    "A128CBC-HS256": (16, 16),
+    "A192CBC-HS384": (16, 24),
+    "A256CBC-HS512": (16, 32),
+    "A128GCM": (12, 16),
+    "A192GCM": (12, 16),
+    "A256GCM": (12, 16),
+}
+AES_MIN_THROUGHPUT = 2 ** 28 # Bytes per second, usually 3x that with AES-NI
+
+
+def aes_cbc_throughput(size=2 ** 14, rounds=64):
+    """Measure the AES-256-CBC encryption throughput in bytes per second,
+    which is about an order of magnitude lower
+    when OpenSSL can't use the AES-NI instructions."""
+    encryptor = Cipher(
+        algorithms.AES(os.urandom(32)),
+        modes.CBC(os.urandom(16)),
+        backend=default_backend(),
+    ).encryptor()
+    data = bytes(size)
+    start = perf_counter()
+    for unused in range(rounds):
+        encryptor.update(data)
+    return size * rounds / (perf_counter() - start)
+
+
 class JWEConverter:
     """
     Bi-directional converter of JSON-like Python dictionary objects
     and their serialized JWE encrypted string representation,
     using a single symmetric key.
     """
-    def __init__(self, octet=None, alg="A256KW", enc="A256CBC-HS512"):
+    def __init__(self, octet=None, alg="A256KW", enc="A256GCM",
+                 legacy_encs=("A256CBC-HS512",)):
         """
         Parameters
         ----------
@@ -37,12 +75,26 @@ class JWEConverter:
         enc : str
             The actual encryption algorithm.
             More information in the section 4.1.2 of RFC7516.
+        legacy_encs : iterable of str
+            Other encryption algorithms still accepted when decrypting,
+            e.g. the ones used by previous versions of this converter.
+            As tokens have no header, the algorithm is chosen
+            by the sizes of the token's initialization vector and tag,
+            which must be distinct for all these algorithms.
         """
         if octet is None:
             self.key = jwk.JWK(generate="oct", size=256)
         else:
             self.key = jwk.JWK(k=octet, kty="oct")
         self.header = {"alg": alg, "enc": enc}
+        self.header_json = json_encode(self.header) # As jwcrypto stores it
+        self.headers_json_by_sizes = {
+            JWE_ENC_IV_TAG_SIZES[dec_enc]:
+                json_encode({"alg": alg, "enc": dec_enc})
+            for dec_enc in [*legacy_encs, enc]
+        }
+        if len(self.headers_json_by_sizes) != len({enc, *legacy_encs}):
+            raise ValueError("Ambiguous encryption algorithms")
 
     def encrypt(self, claims, exp_delta=60 * 5, nbf=None, sub=None):
         """Serialize a Python dictionary object
@@ -65,21 +117,19 @@ class JWEConverter:
             following the RFC7519 specification (Section 4.1).
             The default value is the current timestamp of each call.
         """
-        now = int(time()) # Seconds since Epoch
+        now = time_ns() // 1_000_000_000 # Seconds since Epoch
         payload = ujson.dumps({
             "exp": now + exp_delta,
             "nbf": nbf or now,
             "sub": sub,
             **claims,
         }, ensure_ascii=False).encode("utf-8")
-        etoken = jwe.JWE(payload, header=self.header, recipient=self.key)
+        etoken = jwe.JWE(payload, header=self.header_json, recipient=self.key)
         jwe_dict = etoken.objects
-        return ".".join(map(base64url_encode, [
-            jwe_dict["encrypted_key"],
-            jwe_dict["iv"],
-            jwe_dict["ciphertext"],
-            jwe_dict["tag"],
-        ]))
+        return b".".join([
+            urlsafe_b64encode(jwe_dict[key]).rstrip(b"=")
+            for key in JWE_HEADERLESS_KEYS
+        ]).decode("ascii")
 
     def decrypt(self, token_str, check_exp=True):
         """Convert a serialized JWE token string without its header
@@ -99,24 +149,59 @@ class JWEConverter:
             and the input token have already expired,
             a ``JWEExpired`` exception is raised.
         """
+        if not JWE_HEADERLESS_REGEX.fullmatch(token_str):
+            raise JWEInvalid("Token string isn't a headerless JWE")
+        encrypted_key, iv, ciphertext, tag = token_str.split(".")
+        # Fill the JWE objects just like its deserialize method would do
+        # from the JSON serialization, without actually using JSON
         etoken = jwe.JWE()
-        headerless_jwe = dict(zip(["encrypted_key", "iv", "ciphertext", "tag"],
-                                  token_str.split(".")))
-        etoken_dict = {"header": self.header, **headerless_jwe}
         try:
-            etoken.deserialize(ujson.dumps(etoken_dict))
-        except jwe.InvalidJWEData as exc:
-            raise JWEInvalid("Token string isn't a headerless JWE") from exc
-        etoken.decrypt(self.key)
+            iv_bytes = base64url_decode(iv)
+            tag_bytes = base64url_decode(tag)
+            etoken.objects = {
+                "header": self.headers_json_by_sizes[
+                    len(iv_bytes), len(tag_bytes)
+                ],
+                "encrypted_key": base64url_decode(encrypted_key),
+                "iv": iv_bytes,
+                "ciphertext": base64url_decode(ciphertext),
+                "tag": tag_bytes,
+            }
+            etoken.decrypt(self.key)
+        except (KeyError, ValueError, jwe.InvalidJWEData) as exc:
+            raise JWEInvalid("Token string isn't a valid JWE") from exc
         try:
-            claims = ujson.loads(etoken.payload.decode("utf-8"))
+            claims = ujson.loads(etoken.payload)
         except ValueError as exc:
             raise JWEWithoutJSON("JWE payload isn't JSON") from exc
+        self.check_claims(claims, check_exp=check_exp)
+        return claims
+
+    def check_claims(self, claims, check_exp=True):
+        """Check the required claims of a decrypted JWE token
+        and its time window, raising ``JWEMissingClaim``,
+        ``JWEExpired`` or ``JWENotYetValid`` on failure.
+        See ``decrypt`` for more information about ``check_exp``.
+        """
         for claim_key in ["sub", "exp", "nbf"]:
             if claim_key not in claims:
                 raise JWEMissingClaim(f'"{claim_key}" not found')
-        if check_exp and time() > claims["exp"]:
+        now = time_ns() // 1_000_000_000 # Same int seconds as the claims
+        if check_exp and now >= claims["exp"]: # RFC7519 (Section 4.1.4)
             raise JWEExpired('"exp" claim check failed')
-        if time() < claims["nbf"]:
+        if now < claims["nbf"]:
             raise JWENotYetValid('"nbf" claim check failed')
-        return claims
+
+    @staticmethod
+    def self_test():
+        """Measure the AES throughput with ``aes_cbc_throughput``,
+        logging a warning when it's below ``AES_MIN_THROUGHPUT``.
+        It takes some CPU time, so it's not performed on import:
+        call it once at startup, when no other process is competing
+        for the CPU, or the measurement might be misleading.
+        """
+        throughput = aes_cbc_throughput()
+        if throughput < AES_MIN_THROUGHPUT:
+            logging.warning("Slow AES encryption, "
+                            "is AES-NI disabled in OpenSSL?")
+        return throughput
@@ -1,27 +1,41 @@
+from collections import OrderedDict
 from contextlib import asynccontextmanager
-import re
-from urllib.parse import parse_qs, unquote, urlparse
+from copy import copy
+from time import monotonic
+from urllib.parse import unquote, unquote_plus, urlsplit
 
 import bonsai
 
 
 LDAP_DEFAULT_USER_FIELD = "sAMAccountName"
 LDAP_DEFAULT_SEARCH_TEMPLATE = "(&(objectClass=person)({user_field}={0}))"
+LDAP_ADMIN_POOL_SIZE = 4
+LDAP_USER_CACHE_SIZE = 1024
+LDAP_USER_CACHE_TTL = 60 * 5
 
 
 # Avoid bug described in https://github.com/noirello/bonsai/issues/25
 bonsai.set_connect_async(False)
 
 
+LDAP_DN_ESCAPE_TABLE = str.maketrans({c: "\\" + c for c in ',\\\0#+<>;"='})
+LDAP_QUERY_ESCAPE_TABLE = str.maketrans({c: "\\" + c for c in "*\\\0)("})
+
+
 def ldap_escape_dn(value):
     """Escape a value in a distinguished name
     to perform an LDAP bind (RFC4514)."""
-    return re.sub(r'[,\\\0#+<>;"=]|^ | $', r"\\\g<0>", value)
+    result = value.translate(LDAP_DN_ESCAPE_TABLE)
+    if value.endswith(" ") and len(value) > 1: # Else it's the leading one
+        result = result[:-1] + "\\ "
+    if value.startswith(" "):
+        result = "\\" + result
+    return result
 
 
 def ldap_escape_query(value):
     """Escape a value in an LDAP search query string (RFC4515)."""
-    return re.sub(r"[*\\\0)(]", r"\\\g<0>", value)
+    return value.translate(LDAP_QUERY_ESCAPE_TABLE)
 
 
 class LDAPError(Exception): pass
@@ -60,20 +74,58 @@ class LDAPAuth:
     ``{LDAP_DEFAULT_SEARCH_TEMPLATE}''.
     This template, if customized,
     can access any data in the query string.
+
+    The users found in the search are cached for ``user_cache_ttl``
+    seconds (default: ``{LDAP_USER_CACHE_TTL}``),
+    keeping at most ``user_cache_size`` entries
+    (default: ``{LDAP_USER_CACHE_SIZE}``).
     """
-    def __init__(self, dsn):
-        parsed = urlparse(dsn)
+    __slots__ = (
+        "url", "search_dn", "admin_dn", "admin_pass",
+        "query_dict", "search_template", "format_search_filter",
+        "client_template", "admin_client", "idle_admin_conns",
+        "user_cache", "user_cache_size", "user_cache_ttl",
+    )
+
+    def __init__(self, dsn, *, user_cache_size=LDAP_USER_CACHE_SIZE,
+                               user_cache_ttl=LDAP_USER_CACHE_TTL):
+        parsed = urlsplit(dsn)
         self.url = f"{parsed.scheme}://{parsed.hostname}"
         self.search_dn = unquote(parsed.path)[1:] # Strip leading "/"
         self.admin_dn = unquote(parsed.username)
         self.admin_pass = unquote(parsed.password)
-        qs = parse_qs(parsed.query, keep_blank_values=True)
-        self.query_dict = {
-            "user_field": LDAP_DEFAULT_USER_FIELD,
-            **{k: v[0] for k, v in qs.items()},
-        }
+        qs = {}
+        for pair in parsed.query.split("&") if parsed.query else ():
+            key, unused, value = pair.partition("=")
+            qs.setdefault(unquote_plus(key), unquote_plus(value)) # 1st one
+        self.query_dict = {"user_field": LDAP_DEFAULT_USER_FIELD, **qs}
         self.search_template = unquote(parsed.fragment) \
                                or LDAP_DEFAULT_SEARCH_TEMPLATE
+        # Fill the query string fields in the template just once,
+        # keeping only the "{0}" user field
+        search_filter = self.search_template.format("\0", **self.query_dict)
+        if search_filter.count("\0") == 1: # Usual case, e.g. the default
+            prefix, suffix = search_filter.split("\0")
+            self.format_search_filter = lambda user: prefix + user + suffix
+        else: # Escape everything but the user field
+            self.format_search_filter = (
+                search_filter.replace("{", "{{").replace("}", "}}")
+                             .replace("\0", "{0}")
+                             .format
+            )
+        # Clients are plain Python objects, their shallow copies
+        # share the parsed URL and the certificate policy
+        self.client_template = bonsai.LDAPClient(self.url)
+        self.client_template.set_cert_policy("allow") # TODO: Add certificate
+        self.admin_client = copy(self.client_template)
+        self.admin_client.set_credentials("SIMPLE",
+            user=self.admin_dn,
+            password=self.admin_pass,
+        )
+        self.idle_admin_conns = []
+        self.user_cache = OrderedDict()
+        self.user_cache_size = user_cache_size
+        self.user_cache_ttl = user_cache_ttl
 
     @asynccontextmanager
     async def bind(self, dn, password):
@@ -81,8 +133,7 @@ class LDAPAuth:
         yielding the open connection (``bonsai.Connection`` instance)
         or raising an ``LDAPInvalidCredentials``.
         """
-        client = bonsai.LDAPClient(self.url)
-        client.set_cert_policy("allow") # TODO: Add certificate
+        client = copy(self.client_template)
         client.set_credentials("SIMPLE", user=dn, password=password)
         try:
             async with client.connect(is_async=True) as conn:
@@ -90,6 +141,42 @@ class LDAPAuth:
         except bonsai.AuthenticationError as exc:
             raise LDAPInvalidCredentials from exc
 
+    async def connect_admin(self):
+        """Open a new connection bound with the administrator credentials,
+        raising ``LDAPInvalidAdminCredentials`` if that's not possible.
+        """
+        try:
+            return await self.admin_client.connect(is_async=True)
+        except bonsai.AuthenticationError as exc:
+            raise LDAPInvalidAdminCredentials from exc
+
+    def close_idle_admin_connections(self):
+        """Close all connections kept by ``admin_connection``."""
+        while self.idle_admin_conns:
+            self.idle_admin_conns.pop().close()
+
+    @asynccontextmanager
+    async def admin_connection(self):
+        """Asynchronous context manager yielding an open connection
+        bound with the administrator credentials,
+        or raising an ``LDAPInvalidAdminCredentials``.
+        Connections are reused: at most ``LDAP_ADMIN_POOL_SIZE``
+        of them are kept open while idle.
+        """
+        try:
+            conn = self.idle_admin_conns.pop()
+        except IndexError:
+            conn = await self.connect_admin()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        if len(self.idle_admin_conns) < LDAP_ADMIN_POOL_SIZE:
+            self.idle_admin_conns.append(conn)
+        else:
+            conn.close()
+
     async def get_user_data(self, user, *, attrs=("dn",)):
         """Get the user data in LDAP using the admin credentials.
         The output is a ``bonsai.LDAPEntry`` object, whose keys
@@ -97,18 +184,45 @@ class LDAPAuth:
         (set ``attrs=[]`` or ``None`` to get all non-empty attributes).
         This method might raise ``LDAPUserNotFound``
         or ``LDAPInvalidAdminCredentials``.
+
+        The found entries are cached in this process
+        for ``user_cache_ttl`` seconds (constructor keyword argument),
+        keeping at most the ``user_cache_size`` most recent ones.
         """
+        attrs = None if attrs is None else tuple(attrs)
+        now = monotonic()
         try:
-            async with self.bind(self.admin_dn, self.admin_pass) as conn:
-                search_result = await conn.search(
-                    self.search_dn,
-                    bonsai.LDAPSearchScope.ONELEVEL,
-                    self.search_template.format(ldap_escape_query(user),
-                                                **self.query_dict),
-                    attrlist=None if attrs is None else list(attrs),
-                )
-        except LDAPInvalidCredentials as exc:
-            raise LDAPInvalidAdminCredentials from exc.__cause__
+            expiration, cached_attrs, user_data = self.user_cache[user]
+        except KeyError:
+            pass
+        else:
+            if expiration > now and cached_attrs == attrs:
+                self.user_cache.move_to_end(user)
+                return user_data
+        user_data = await self.search_user_data(user, attrs=attrs)
+        self.user_cache[user] = now + self.user_cache_ttl, attrs, user_data
+        self.user_cache.move_to_end(user)
+        if len(self.user_cache) > self.user_cache_size:
+            self.user_cache.popitem(last=False)
+        return user_data
+
+    async def search_user_data(self, user, *, attrs=("dn",)):
+        """Non-cached version of ``get_user_data``."""
+        search_args = (
+            self.search_dn,
+            bonsai.LDAPSearchScope.ONELEVEL,
+            self.format_search_filter(ldap_escape_query(user)),
+        )
+        attrlist = None if attrs is None else list(attrs)
+        try:
+            async with self.admin_connection() as conn:
+                search_result = await conn.search(*search_args,
+                                                  attrlist=attrlist)
+        except bonsai.ConnectionError: # The idle ones might be closed
+            self.close_idle_admin_connections()
+            async with self.admin_connection() as conn:
+                search_result = await conn.search(*search_args,
+                                                  attrlist=attrlist)
         if not search_result:
             raise LDAPUserNotFound
         return search_result[0]
@@ -130,10 +244,18 @@ class LDAPAuth:
             No user search was performed, as the administrator account
             DN and/or password is wrong.
         """
+        if not user: # Nothing to search for
+            raise LDAPUserNotFound
+        if not password: # It would be an unauthenticated bind (RFC4513)
+            raise LDAPInvalidCredentials
         user_data = await self.get_user_data(user, **kwargs)
         dn = str(user_data["dn"])
-        async with self.bind(dn, password):
-            return user_data
+        try:
+            async with self.bind(dn, password):
+                return user_data
+        except LDAPInvalidCredentials:
+            self.user_cache.pop(user, None) # The DN might have changed
+            raise
 
 
 LDAPAuth.__doc__ = LDAPAuth.__doc__.format(**globals())
@@ -53,6 +53,7 @@ t_document_event = Table(
 parent_hist_index = Index("parent_hist_index",
     t_document_event.c.parent, t_document_event.c.hist,
     unique=True,
+    postgresql_where=t_document_event.c.parent != SQL_NULL,
 )
 
 null_hist_index = Index("null_hist_index",
@@ -61,6 +62,8 @@ null_hist_index = Index("null_hist_index",
     postgresql_where=t_document_event.c.parent == SQL_NULL,
 )
 
+hist_index = Index("hist_index", t_document_event.c.hist)
+
 t_snapshot = Table(
     "snapshot", metadata,
     Column("data", JSONB, nullable=False),
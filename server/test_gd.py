@@ -0,0 +1,43 @@
+import os
+import unittest
+from uuid import uuid4
+
+import ujson
+
+# Required by gd on import, the LDAP server isn't contacted by these tests
+os.environ.setdefault("GD_LDAP_DSN", "ldap://cn=admin:pw@localhost/dc=gd")
+os.environ.setdefault("GD_JWK_OCTET", "A" * 43)
+os.environ.setdefault("GD_NO_STATIC", "1")
+
+
+@unittest.skipUnless("GD_PGSQL_DSN" in os.environ,
+                     "GD_PGSQL_DSN is required to start the server")
+class TestPostDocumentBatch(unittest.TestCase):
+
+    def post_batch(self, *payloads):
+        import gd
+        token = gd.jwe.jc.encrypt({"r": "admin"}, sub="test")
+        request, resp = gd.app.test_client.post(
+            "/document/batch",
+            data="\n".join(map(ujson.dumps, payloads)),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        return resp
+
+    def test_urn_uuid_parent(self):
+        resp = self.post_batch({
+            "pid": "S0000-00002019000100001",
+            "title": "Title",
+            "parent": uuid4().urn,
+        })
+        self.assertEqual(resp.status, 400)
+        self.assertEqual(resp.json, {"error": "invalid_parent"})
+
+    def test_non_object_payload(self):
+        resp = self.post_batch(None)
+        self.assertEqual(resp.status, 400)
+        self.assertEqual(resp.json, {"error": "need_json_object"})
+
+
+if __name__ == "__main__":
+    unittest.main()